@@ -1,22 +1,554 @@
 import streamlit as st
 import os
-from crewai import Agent, Task, Crew, Process
-from crewai_tools import TavilySearchTool
-from langchain_openai import ChatOpenAI
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import pathlib
+import shutil
+import sqlite3
+import threading
+import time
+import httpx
+import numpy as np
+
+# CrewAI, LangChain et OpenAI ne sont importés qu'au moment de les utiliser
+# (dans les fonctions appelées au clic) : ils ajoutent plusieurs secondes au
+# chargement de la page. Le cache des modules de Python rend les imports
+# suivants gratuits.
+
+# --- Journalisation (logs affichés avec CREW_VERBOSE=1) ---
+# Les logs détaillés des agents sont écrits de façon synchrone : on ne les
+# active que sur demande, pour le développement
+VERBOSE = os.getenv("CREW_VERBOSE", "0") == "1"
+
+
+class DequeHandler(logging.Handler):
+    """Garde en mémoire les derniers messages de log pour les afficher dans la page."""
+
+    def __init__(self, maxlen=1000):
+        super().__init__()
+        self.messages = collections.deque(maxlen=maxlen)
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+@st.cache_resource(show_spinner=False)
+def get_log_handler():
+    """Installe, une seule fois par processus, le handler qui collecte les logs."""
+    handler = DequeHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    for nom in ("generateur_scripts", "crewai", "httpx", "openai"):
+        journal = logging.getLogger(nom)
+        journal.addHandler(handler)
+        journal.setLevel(logging.INFO)
+    return handler
+
+
+# --- Cache exact des scripts générés (sur disque) ---
+MODELE_LLM = "gpt-4o"
+# Modèle plus rapide et moins cher pour l'analyse et la recherche, qui
+# n'exigent pas le modèle phare
+MODELE_RAPIDE = "gpt-4o-mini"
+CACHE_DIR = pathlib.Path(".script_cache")
+
+
+def chemin_cache_exact(topic, duration):
+    """Chemin du script mis en cache pour ce sujet, cette durée et ces modèles."""
+    cle = hashlib.sha256(
+        json.dumps(
+            {"topic": topic, "duration": duration, "model": MODELE_LLM, "model_fast": MODELE_RAPIDE},
+            sort_keys=True,
+        ).encode("utf-8")
+    ).hexdigest()
+    return CACHE_DIR / f"{cle}.md"
+
+
+def ecrire_cache_exact(topic, duration, script):
+    """Mémorise le script dans le cache exact."""
+    CACHE_DIR.mkdir(exist_ok=True)
+    chemin_cache_exact(topic, duration).write_text(script, encoding="utf-8")
+
+
+# --- Cache sémantique des scripts générés ---
+SEUIL_SIMILARITE = 0.92
+MODELE_EMBEDDING = "text-embedding-3-small"
+
+
+DIMENSION_EMBEDDING = 1536
+
+
+@st.cache_resource
+def get_openai_client(openai_api_key):
+    """Client OpenAI des embeddings, créé une seule fois par clé plutôt qu'à chaque clic."""
+    from openai import OpenAI
+
+    return OpenAI(api_key=openai_api_key)
+
+
+def calculer_embedding(client, topic):
+    """Calcule l'embedding du sujet, normalisé (norme L2)."""
+    response = client.embeddings.create(model=MODELE_EMBEDDING, input=topic)
+    emb = np.asarray(response.data[0].embedding, dtype=np.float32)
+    return emb / np.linalg.norm(emb)
+
+
+@st.cache_data(max_entries=1000, show_spinner=False)
+def embed_topic(_client, topic):
+    """`calculer_embedding`, mis en cache par sujet."""
+    return calculer_embedding(_client, topic)
+
+
+class SemanticCache:
+    """Cache des scripts générés, retrouvés par similarité cosinus sur l'embedding du sujet.
+
+    Un script n'est réutilisé que pour une vidéo de même durée. Les entrées
+    sont persistées dans une base SQLite locale (clé = SHA-256 de la durée et
+    du sujet) et survivent aux redémarrages du serveur. Les embeddings sont
+    gardés en mémoire dans une seule matrice, de sorte qu'une recherche se
+    résume à un produit matriciel.
+    """
+
+    def __init__(self, chemin_db):
+        self.conn = sqlite3.connect(chemin_db, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS scripts ("
+                "sha256 TEXT PRIMARY KEY, topic TEXT, duration INTEGER, "
+                "embedding BLOB, markdown TEXT, ts REAL)"
+            )
+        lignes = self.conn.execute("SELECT sha256, duration, embedding FROM scripts").fetchall()
+        self.cles = [cle for cle, _, _ in lignes]
+        self.durees = np.array([duree for _, duree, _ in lignes], dtype=np.int64)
+        self.embeddings = np.array(
+            [np.frombuffer(emb, dtype=np.float32) for _, _, emb in lignes], dtype=np.float32
+        ).reshape(-1, DIMENSION_EMBEDDING)
+
+    def lookup(self, emb, duration):
+        """Retourne le script du sujet le plus proche, pour cette durée, si la similarité atteint le seuil."""
+        with self.lock:
+            if not self.cles:
+                return None
+            scores = np.where(self.durees == duration, self.embeddings @ emb, -1.0)
+            meilleur = int(np.argmax(scores))
+            if scores[meilleur] < SEUIL_SIMILARITE:
+                return None
+            ligne = self.conn.execute(
+                "SELECT markdown FROM scripts WHERE sha256 = ?", (self.cles[meilleur],)
+            ).fetchone()
+        return ligne[0]
+
+    def append(self, emb, topic, duration, markdown):
+        cle = hashlib.sha256(f"{duration}:{topic}".encode("utf-8")).hexdigest()
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO scripts VALUES (?, ?, ?, ?, ?, ?)",
+                    (cle, topic, duration, emb.astype(np.float32).tobytes(), markdown, time.time()),
+                )
+            if cle in self.cles:
+                self.embeddings[self.cles.index(cle)] = emb
+            else:
+                self.cles.append(cle)
+                self.durees = np.append(self.durees, duration)
+                self.embeddings = np.vstack([self.embeddings, emb])
+
+    def vider(self):
+        """Supprime toutes les entrées, en base comme en mémoire."""
+        with self.lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM scripts")
+            self.cles = []
+            self.durees = np.empty(0, dtype=np.int64)
+            self.embeddings = np.empty((0, DIMENSION_EMBEDDING), dtype=np.float32)
+
+
+@st.cache_resource
+def get_semantic_cache(chemin_db=".sem_cache.db"):
+    """Cache sémantique partagé par toutes les sessions, chargé une seule fois."""
+    return SemanticCache(chemin_db)
+
+
+# --- Client HTTP des recherches Tavily ---
+@st.cache_resource
+def get_http_client():
+    """Client HTTP/2 partagé par toutes les recherches Tavily.
+
+    Les connexions restent ouvertes d'une requête à l'autre (pas de nouvelle
+    poignée de main TLS) et les requêtes simultanées sont multiplexées sur une
+    même connexion.
+    """
+    return httpx.Client(
+        http2=True,
+        timeout=30,
+        limits=httpx.Limits(max_keepalive_connections=10),
+    )
+
+
+# --- Ressources partagées du Crew ---
+@st.cache_resource
+def get_search_tool(tavily_api_key):
+    """Outil de recherche, partagé entre les exécutions pour une même clé Tavily."""
+    from crew_factory import BatchTavilyTool
+
+    return BatchTavilyTool(max_results=3, http_client=get_http_client(), api_key=tavily_api_key)
+
+
+# Budgets de tokens en sortie : l'analyse et la recherche produisent des
+# listes courtes, le script environ 150 mots par minute de vidéo (~1,2 token
+# par mot)
+MAX_TOKENS_RAPIDE = 600
+TOKENS_PAR_MINUTE = 180
+# Le Markdown du plan (titres, une partie par angle) et les URL citées
+# s'ajoutent au texte lu : marge au-delà du budget par minute
+MARGE_TOKENS_SCRIPT = 1000
+# Le prompt fusionné produit aussi les angles et les faits sourcés avant le
+# script : il lui faut une marge en plus du budget du rédacteur
+MAX_TOKENS_FUSION_SUPPLEMENT = 1000
+
+
+def creer_llms(openai_api_key, duration, stream=False):
+    """Construit les LLMs CrewAI de l'analyse/recherche et de la rédaction.
+
+    CrewAI appelle ces LLMs lui-même, sans callbacks LangChain : avec
+    `stream=True`, leurs tokens sont publiés sur le bus d'événements de CrewAI
+    (voir `streaming.diffuser_crew`).
+    """
+    from crewai import LLM
+
+    # Analyse et recherche : gpt-4o-mini à température nulle, pour des sorties
+    # stables d'une exécution à l'autre
+    llm_fast = LLM(
+        model=MODELE_RAPIDE,
+        api_key=openai_api_key,
+        temperature=0,
+        max_tokens=MAX_TOKENS_RAPIDE,
+        stream=stream,
+    )
+    # Rédaction : gpt-4o comme dans le notebook
+    llm_writer = LLM(
+        model=MODELE_LLM,
+        api_key=openai_api_key,
+        temperature=0.4,
+        max_tokens=budget_redaction(duration),
+        stream=stream,
+    )
+    return llm_fast, llm_writer
+
+
+def budget_redaction(duration):
+    """Nombre maximal de tokens en sortie pour un script de cette durée."""
+    return int(duration * TOKENS_PAR_MINUTE) + MARGE_TOKENS_SCRIPT
+
+
+@st.cache_resource
+def get_llms(openai_api_key, duration):
+    """LLMs des agents, partagés entre les exécutions pour une même clé OpenAI et une même durée.
+
+    La durée fixe le budget de tokens du rédacteur. Les LLMs sont en streaming
+    pour afficher la génération au fur et à mesure.
+    """
+    return creer_llms(openai_api_key, duration, stream=True)
+
+
+@st.cache_resource
+def get_llm_fusion(openai_api_key, duration):
+    """LLM du prompt fusionné, appelé directement et non par un agent.
+
+    Il ne porte pas de callbacks : il est partagé entre les sessions, le
+    handler d'affichage est passé à chaque appel. Réutiliser le client conserve
+    son pool de connexions HTTP d'un clic à l'autre.
+    """
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=MODELE_LLM,
+        api_key=openai_api_key,
+        temperature=0.4,
+        max_tokens=budget_redaction(duration) + MAX_TOKENS_FUSION_SUPPLEMENT,
+        streaming=True,
+    )
+
+
+def lancer_crew(topic, duration, openai_api_key, tavily_api_key):
+    """Lance le Crew sur le sujet.
+
+    Retourne le script en Markdown et un booléen, faux si la rédaction a été
+    coupée par la limite de tokens.
+    """
+    from crew_factory import (
+        angles_recherche, creer_crew_script, creer_crew_tendances, script_complet, texte_resultat,
+    )
+    from streaming import StreamlitTokenHandler, diffuser_crew
+
+    # Récupérer les LLMs et l'outil de recherche (créés au premier clic
+    # seulement) ; les agents sont construits avec chaque Crew
+    with st.spinner("🛠️ Initialisation des outils et du LLM..."):
+        llm_fast, llm_writer = get_llms(openai_api_key, duration)
+        search_tool = get_search_tool(tavily_api_key)
+    handler = StreamlitTokenHandler(st.container())
+
+    with st.spinner("📈 Analyse des tendances..."):
+        crew_tendances = creer_crew_tendances(search_tool, llm_fast, VERBOSE)
+        with diffuser_crew(crew_tendances, handler):
+            tendances = crew_tendances.kickoff(inputs={'topic': topic})
+
+    st.info("🚀 Assemblage du Crew et lancement de la mission...")
+    video_crew = creer_crew_script(search_tool, llm_fast, llm_writer, angles_recherche(tendances), VERBOSE)
+
+    # Lancer le kickoff dans un spinner
+    with st.spinner("🤖 L'équipe est au travail ! (Cela peut prendre 1 à 2 minutes)"):
+        with diffuser_crew(video_crew, handler):
+            result = video_crew.kickoff(inputs={'topic': topic, 'duration': duration})
+
+    return texte_resultat(result), script_complet(video_crew)
+
+
+# --- Génération en un seul appel pour les vidéos courtes ---
+# En dessous de cette durée, les allers-retours entre les trois agents coûtent
+# plus cher que le travail lui-même : un seul appel au rédacteur suffit
+DUREE_MAX_FUSION = 3
+
+# Les instructions statiques viennent en premier pour profiter du cache de
+# prompt d'OpenAI ; les valeurs propres à l'exécution sont à la fin
+PROMPT_FUSIONNE = """Vous êtes à la fois analyste de tendances vidéo, fact-checker et scénariste.
+En vous appuyant uniquement sur les résultats de recherche web fournis :
+1. Identifiez les 3 angles et sous-sujets les plus populaires et les questions que se posent les gens.
+2. Pour chaque angle, retenez 2-3 faits marquants, statistiques ou exemples concrets, chacun avec son URL source.
+3. Rédigez un plan de script vidéo complet en Markdown, incluant une intro, une partie par angle
+   et une conclusion. Les citations sources doivent être incluses.
+
+Sujet : {topic}
+Durée visée de la vidéo : {duration} minutes
+
+Résultats de recherche :
+{resultats}
+"""
+
+
+def generer_script_fusionne(topic, duration, llm, search_tool, callbacks=None):
+    """Génère le script en un seul appel LLM, sans passer par le Crew ni afficher.
+
+    Retourne le script et un booléen, faux si la réponse a été coupée par la
+    limite de tokens.
+    """
+    resultats = search_tool.run(queries=[
+        topic,
+        f"{topic} statistiques chiffres clés",
+        f"{topic} questions fréquentes",
+    ])
+    reponse = llm.invoke(
+        PROMPT_FUSIONNE.format(topic=topic, duration=duration, resultats=resultats),
+        config={"callbacks": callbacks or []},
+    )
+    complet = reponse.response_metadata.get("finish_reason") != "length"
+    return reponse.content, complet
+
+
+def lancer_prompt_fusionne(topic, duration, openai_api_key, tavily_api_key):
+    """Génère le script en un seul appel LLM, en affichant la rédaction."""
+    from streaming import StreamlitTokenHandler
+
+    handler = StreamlitTokenHandler(st.container())
+    with st.spinner("🔎 Recherche web et rédaction du script..."):
+        return generer_script_fusionne(
+            topic,
+            duration,
+            get_llm_fusion(openai_api_key, duration),
+            get_search_tool(tavily_api_key),
+            callbacks=[handler],
+        )
+
+
+# --- Génération en lot ---
+def generer_lot(topics, duration, openai_api_key, tavily_api_key):
+    """Génère et affiche les scripts d'un lot de sujets.
+
+    Chaque sujet suit le même chemin qu'une génération seule : cache exact,
+    puis cache sémantique, puis prompt fusionné ou Crew selon la durée. Seuls
+    les sujets absents des deux caches sont générés, en parallèle.
+    """
+    from crew_factory import lancer_crew_async, lancer_lot, relancer_si_limite_debit
+
+    cache = get_semantic_cache()
+    client = get_openai_client(openai_api_key)
+    scripts = {}
+    embeddings = {}
+    for topic in topics:
+        chemin = chemin_cache_exact(topic, duration)
+        if chemin.exists():
+            scripts[topic] = chemin.read_text(encoding="utf-8")
+            continue
+        embeddings[topic] = embed_topic(client, topic)
+        script = cache.lookup(embeddings[topic], duration)
+        if script is not None:
+            scripts[topic] = script
+            ecrire_cache_exact(topic, duration, script)
+
+    a_generer = [t for t in topics if t not in scripts]
+    erreurs = {}
+    tronques = set()
+    if a_generer:
+        if duration <= DUREE_MAX_FUSION:
+            llm = get_llm_fusion(openai_api_key, duration)
+            search_tool = get_search_tool(tavily_api_key)
+            # Même relance sur limite de débit que pour les Crews
+            generer_fusionne = relancer_si_limite_debit(generer_script_fusionne)
+
+            async def generer(topic):
+                return await asyncio.to_thread(generer_fusionne, topic, duration, llm, search_tool)
+        else:
+            llm_fast, llm_writer = get_llms(openai_api_key, duration)
+            search_tool = get_search_tool(tavily_api_key)
+
+            async def generer(topic):
+                return await lancer_crew_async(topic, duration, search_tool, llm_fast, llm_writer, VERBOSE)
+
+        with st.spinner(f"🤖 Génération de {len(a_generer)} scripts en parallèle..."):
+            resultats = asyncio.run(lancer_lot(a_generer, generer))
+
+        for topic, resultat in zip(a_generer, resultats):
+            if isinstance(resultat, Exception):
+                erreurs[topic] = resultat
+                continue
+            script, complet = resultat
+            scripts[topic] = script
+            # Comme pour un sujet seul, un script tronqué n'est pas mis en cache
+            if complet:
+                cache.append(embeddings[topic], topic, duration, script)
+                ecrire_cache_exact(topic, duration, script)
+            else:
+                tronques.add(topic)
+
+    st.success(f"✅ Lot terminé : {len(topics) - len(erreurs)} script(s) sur {len(topics)}.")
+    for topic in topics:
+        with st.expander(topic):
+            if topic in erreurs:
+                st.error(f"❌ Une erreur est survenue pour ce sujet : {erreurs[topic]}")
+                continue
+            if topic in tronques:
+                st.warning("⚠️ Le script a atteint la limite de tokens et semble incomplet : il n'a pas été mis en cache.")
+            st.markdown(scripts[topic])
+
+
+# --- Préchargement des sujets tendance ---
+# Un sujet par ligne. Sans ce fichier, rien n'est préchargé
+FICHIER_SUJETS_TENDANCE = pathlib.Path("trending_topics.txt")
+INTERVALLE_PRECHARGEMENT = 600  # Secondes entre deux générations, pour borner le coût
+DUREE_PAR_DEFAUT = 5
+
+
+def precharger_sujets(openai_api_key, tavily_api_key, http_client, cache):
+    """Génère un à un les scripts des sujets tendance absents du cache sémantique.
+
+    Tourne dans son propre thread, imports lourds et construction des LLMs
+    compris : la page n'attend pas CrewAI, et un échec est seulement journalisé.
+    """
+    logger = logging.getLogger("generateur_scripts")
+    try:
+        from openai import OpenAI
+        from crew_factory import BatchTavilyTool, lancer_crew_async
+
+        topics = [
+            ligne.strip()
+            for ligne in FICHIER_SUJETS_TENDANCE.read_text(encoding="utf-8").splitlines()
+            if ligne.strip()
+        ]
+        client = OpenAI(api_key=openai_api_key)
+        # LLMs sans streaming : cette génération n'est affichée sur aucune page
+        llm_fast, llm_writer = creer_llms(openai_api_key, DUREE_PAR_DEFAUT)
+        search_tool = BatchTavilyTool(max_results=3, http_client=http_client, api_key=tavily_api_key)
+    except Exception:
+        logger.exception("Échec de l'initialisation du préchargement")
+        return
+
+    for topic in topics:
+        try:
+            emb = calculer_embedding(client, topic)
+            if cache.lookup(emb, DUREE_PAR_DEFAUT) is not None:
+                continue
+            script, complet = asyncio.run(
+                lancer_crew_async(topic, DUREE_PAR_DEFAUT, search_tool, llm_fast, llm_writer, VERBOSE)
+            )
+            # Un script tronqué serait resservi tel quel depuis le cache
+            if complet:
+                cache.append(emb, topic, DUREE_PAR_DEFAUT, script)
+            else:
+                logger.warning("Script tronqué, non mis en cache, pour le sujet : %s", topic)
+        except Exception:
+            logger.exception("Échec du préchargement pour le sujet : %s", topic)
+        time.sleep(INTERVALLE_PRECHARGEMENT)
+
+
+@st.cache_resource(show_spinner=False)
+def demarrer_prechargement(openai_api_key, tavily_api_key):
+    """Lance, une seule fois par processus, le préchargement en tâche de fond.
+
+    Les premiers utilisateurs qui demandent un sujet tendance tombent ainsi
+    directement sur le cache sémantique.
+    """
+    thread = threading.Thread(
+        target=precharger_sujets,
+        args=(openai_api_key, tavily_api_key, get_http_client(), get_semantic_cache()),
+        name="prechargement-sujets",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+# --- Clés API ---
+def get_secret_keys():
+    """Retourne les clés (OpenAI, Tavily) définies dans `st.secrets`, ou None."""
+    try:
+        return st.secrets["OPENAI_API_KEY"], st.secrets["TAVILY_API_KEY"]
+    except (KeyError, FileNotFoundError):
+        return None
+
+
+def get_api_keys():
+    """Retourne les clés (OpenAI, Tavily) : `st.secrets` en priorité, sinon la barre latérale."""
+    cles = get_secret_keys()
+    if cles is not None:
+        st.sidebar.markdown("✅ Clés API chargées depuis les secrets de l'application.")
+        return cles
+    st.sidebar.markdown("Veuillez entrer vos clés API pour utiliser l'application.")
+    openai_api_key = st.sidebar.text_input("OpenAI API Key", type="password")
+    tavily_api_key = st.sidebar.text_input("Tavily API Key", type="password")
+    return openai_api_key, tavily_api_key
+
 
 # --- Configuration de la page Streamlit ---
 st.set_page_config(page_title="🎥 Générateur de Scripts Vidéo", layout="wide")
 
+if VERBOSE:
+    get_log_handler()
+
+# Le préchargement n'utilise que les clés du serveur, jamais celles saisies
+# par un utilisateur
+cles_serveur = get_secret_keys()
+if cles_serveur is not None and FICHIER_SUJETS_TENDANCE.exists():
+    demarrer_prechargement(*cles_serveur)
+
 # --- Barre latérale pour les clés API ---
 st.sidebar.title("🔑 Configuration des Clés API")
-st.sidebar.markdown("Veuillez entrer vos clés API pour utiliser l'application.")
-
-openai_api_key = st.sidebar.text_input("OpenAI API Key", type="password")
-tavily_api_key = st.sidebar.text_input("Tavily API Key", type="password")
+openai_api_key, tavily_api_key = get_api_keys()
 
 st.sidebar.markdown("---")
 st.sidebar.markdown("Cette application utilise un 'Crew' d'agents IA pour générer des scripts vidéo basés sur votre sujet.")
 
+if st.sidebar.button("🗑️ Vider le cache"):
+    # Les deux caches doivent être vidés : sinon le cache sémantique resservirait
+    # le même script (similarité 1.0) et réécrirait aussitôt le cache exact
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    # Vider l'instance existante plutôt que d'en créer une nouvelle : le thread
+    # de préchargement garde une référence à celle-ci
+    get_semantic_cache().vider()
+    st.sidebar.success("Cache vidé.")
+
 # --- Interface Principale ---
 st.title("🎥 Générateur de Scripts Vidéo (CrewAI)")
 st.markdown("""
@@ -33,130 +565,83 @@ sujet_video = st.text_area(
     height=100
 )
 
+duree_video = st.slider("Durée de la vidéo (minutes)", min_value=1, max_value=20, value=DUREE_PAR_DEFAUT)
+
+mode_lot = st.checkbox("📚 Mode lot : générer un script pour plusieurs sujets")
+if mode_lot:
+    sujets_lot = st.text_area("Sujets du lot (un par ligne)", height=150)
+
 # --- Logique d'exécution du Crew ---
 if st.button("🚀 Lancer la Génération du Script"):
-    
+
     # 1. Valider les clés API
     if not openai_api_key or not tavily_api_key:
         st.error("❌ Veuillez entrer vos clés API OpenAI et Tavily dans la barre latérale pour continuer.")
         st.stop()
 
-    # 2. Définir les variables d'environnement pour cette exécution
+    # 2. Réutiliser directement un script déjà généré pour ce sujet exact
+    chemin_script = chemin_cache_exact(sujet_video, duree_video)
+    if not mode_lot and chemin_script.exists():
+        st.info("⚡ Ce script a déjà été généré, il est servi depuis le cache.")
+        st.markdown("---")
+        st.subheader("Script Vidéo Généré")
+        st.markdown(chemin_script.read_text(encoding="utf-8"))
+        st.stop()
+
+    # 3. Définir les variables d'environnement pour cette exécution
     os.environ["OPENAI_API_KEY"] = openai_api_key
     os.environ["TAVILY_API_KEY"] = tavily_api_key
 
     try:
-        # 3. Initialiser les outils et le LLM
-        with st.spinner("🛠️ Initialisation des outils et du LLM..."):
-            web_search_tool = TavilySearchTool(max_results=3)
-            # Utilise le modèle gpt-4o comme dans le notebook
-            llm = ChatOpenAI(model="gpt-4o")
-
-        st.info("🤖 Création des agents du Crew...")
-
-        # 4. Définir les Agents (copiés de votre notebook)
-        # --- Agent 1: L'Analyste des Tendances ---
-        trend_analyst = Agent(
-            role="Analyste de Tendances Vidéo",
-            goal="Identifier les 3 angles et sous-sujets les plus populaires et les questions "
-                 "que se posent les gens sur le sujet : {topic}",
-            backstory="Vous êtes un expert en stratégie de contenu YouTube. Vous savez "
-                      "détecter ce qui captive le public et génère de l'engagement.",
-            tools=[web_search_tool],
-            llm=llm,
-            verbose=False,  # Mettre à False pour une UI Streamlit propre
-            allow_delegation=False
-        )
-
-        # --- Agent 2: Le Chercheur (RAG) ---
-        research_agent = Agent(
-            role="Chercheur Web Senior",
-            goal="Pour chaque angle identifié, trouver 2-3 faits marquants, statistiques, ou "
-                 "exemples concrets. **Chaque fait doit être accompagné de son URL source**.",
-            backstory="Vous êtes un 'fact-checker' méticuleux. Votre mission est de "
-                      "fournir des informations vérifiables et sourcées pour "
-                      "construire la crédibilité du script.",
-            tools=[web_search_tool],
-            llm=llm,
-            verbose=False,
-            allow_delegation=False
-        )
-
-        # --- Agent 3: Le Rédacteur de Script ---
-        script_writer = Agent(
-            role="Rédacteur de Scripts Vidéo",
-            goal="Rédiger un plan de script vidéo (format Markdown) basé sur les tendances et "
-                 "les faits bruts fournis. Le script doit être structuré (Intro, "
-                 "Parties, Conclusion) et **intégrer les citations**.",
-            backstory="Vous êtes un scénariste de talent, capable de transformer "
-                      "des informations brutes en une histoire engageante et rythmée.",
-            llm=llm,
-            verbose=False,
-            allow_delegation=False
-        )
-
-        st.info("📋 Définition des tâches...")
-
-        # 5. Définir les Tâches (copiées de votre notebook)
-        # Tâche 1: Trouver les tendances
-        task_trends = Task(
-            description="Analyser les tendances actuelles et les questions populaires pour le sujet : {topic}.",
-            expected_output="Une liste de 3 angles de script pertinents et les questions clés.",
-            agent=trend_analyst,
-            async_execution=False # Streamlit fonctionne mieux en séquentiel
-        )
-
-        # Tâche 2: Rechercher les faits
-        task_research = Task(
-            description="Collecter des faits, statistiques et sources pour les angles identifiés.",
-            expected_output="Un rapport structuré avec des faits et leurs URL sources pour chaque angle.",
-            agent=research_agent,
-            context=[task_trends],
-            async_execution=False
-        )
-
-        # Tâche 3: Rédiger le script
-        task_script = Task(
-            description="Rédiger le plan détaillé du script vidéo en utilisant les angles et les faits sourcés.",
-            expected_output="Un script vidéo complet en Markdown, incluant une intro, "
-                            "plusieurs parties (une par angle) et une conclusion. "
-                            "Les citations sources doivent être incluses.",
-            agent=script_writer,
-            context=[task_research],
-            async_execution=False
-        )
-
-        st.info("🚀 Assemblage du Crew et lancement de la mission...")
+        if mode_lot:
+            # 4. Générer tous les sujets du lot en parallèle
+            sujets = list(dict.fromkeys(l.strip() for l in sujets_lot.splitlines() if l.strip()))
+            if not sujets:
+                st.error("❌ Veuillez entrer au moins un sujet pour le lot, un par ligne.")
+            else:
+                generer_lot(sujets, duree_video, openai_api_key, tavily_api_key)
+        else:
+            # 4. Chercher un script déjà généré pour un sujet similaire
+            cache = get_semantic_cache()
+            emb_sujet = embed_topic(get_openai_client(openai_api_key), sujet_video)
+            script = cache.lookup(emb_sujet, duree_video)
+            complet = True
 
-        # 6. Créer et Lancer le Crew
-        video_crew = Crew(
-            agents=[trend_analyst, research_agent, script_writer],
-            tasks=[task_trends, task_research, task_script],
-            process=Process.sequential,  # Processus séquentiel comme dans le notebook
-            verbose=False # Mettre à 2 pour voir les logs dans le terminal
-        )
+            if script is not None:
+                st.info("⚡ Un script a déjà été généré pour un sujet similaire.")
+            else:
+                # 5. Générer le script (un seul appel pour les vidéos courtes, le
+                #    Crew complet sinon), puis mémoriser le résultat
+                if duree_video <= DUREE_MAX_FUSION:
+                    script, complet = lancer_prompt_fusionne(sujet_video, duree_video, openai_api_key, tavily_api_key)
+                else:
+                    script, complet = lancer_crew(sujet_video, duree_video, openai_api_key, tavily_api_key)
+                if complet:
+                    cache.append(emb_sujet, sujet_video, duree_video, script)
 
-        # Lancer le kickoff dans un spinner
-        with st.spinner("🤖 L'équipe est au travail ! (Cela peut prendre 1 à 2 minutes)"):
-            result = video_crew.kickoff(inputs={'topic': sujet_video})
+            # Un script tronqué n'est pas mis en cache : il serait resservi tel quel
+            if complet:
+                ecrire_cache_exact(sujet_video, duree_video, script)
+            else:
+                st.warning("⚠️ Le script a atteint la limite de tokens et semble incomplet : il n'a pas été mis en cache.")
 
-        # 7. Afficher le résultat
-        st.success("✅ Mission terminée ! Voici votre script.")
-        st.markdown("---")
-        st.subheader("Script Vidéo Généré")
-        
-        # Le 'result.raw' contient le Markdown final
-        if result and hasattr(result, 'raw'):
-            st.markdown(result.raw)
-        else:
-            st.write(result) # Fallback si .raw n'existe pas
+            # 6. Afficher le résultat
+            st.success("✅ Mission terminée ! Voici votre script.")
+            st.markdown("---")
+            st.subheader("Script Vidéo Généré")
+            st.markdown(script)
 
     except Exception as e:
         st.error(f"❌ Une erreur est survenue pendant l'exécution du Crew : {e}")
         st.error("Veuillez vérifier vos clés API, vos crédits OpenAI et que le modèle 'gpt-4o' est disponible.")
 
-    # 8. Nettoyer les variables d'environnement après l'exécution
+    # 7. Nettoyer les variables d'environnement après l'exécution
     if "OPENAI_API_KEY" in os.environ:
         del os.environ["OPENAI_API_KEY"]
     if "TAVILY_API_KEY" in os.environ:
         del os.environ["TAVILY_API_KEY"]
+
+# --- Logs de débogage (uniquement avec CREW_VERBOSE=1) ---
+if VERBOSE:
+    with st.expander("🐞 Debug logs"):
+        st.code("\n".join(get_log_handler().messages))
@@ -0,0 +1,310 @@
+"""Construction des agents, outils, tâches et Crews du générateur de scripts vidéo.
+
+Ce module ne dépend pas de Streamlit : l'application se charge de mettre en
+cache les objets construits ici et d'afficher leur progression. Il importe
+CrewAI et ses dépendances, qui sont lourdes : l'application ne le charge
+qu'au premier lancement d'une génération.
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from crewai import Agent, Task, Crew, Process
+from crewai.events import crewai_event_bus
+from crewai.events.types.llm_events import LLMCallCompletedEvent
+from crewai.tools import BaseTool
+from openai import RateLimitError
+from pydantic import BaseModel, Field
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+logger = logging.getLogger("generateur_scripts")
+
+NB_ANGLES = 3
+
+
+class AnglesTendances(BaseModel):
+    """Sortie structurée de l'analyste, pour répartir la recherche par angle."""
+
+    angles: list[str]
+    questions: list[str]
+
+
+def journaliser_etape(etape):
+    logger.info("Étape d'agent : %s", etape)
+
+
+# --- Recherche Tavily groupée ---
+TAVILY_URL = "https://api.tavily.com/search"
+# L'agent choisit le nombre de requêtes : on borne celui des threads
+MAX_RECHERCHES_PARALLELES = 5
+
+
+class BatchSearchInput(BaseModel):
+    queries: list[str] = Field(..., description="Toutes les requêtes de recherche à lancer.")
+
+
+class BatchTavilyTool(BaseTool):
+    """Lance plusieurs recherches Tavily en parallèle, sur le client HTTP partagé.
+
+    L'agent envoie toutes ses requêtes en un seul appel d'outil : le temps
+    d'attente est celui de la requête la plus lente et non leur somme.
+    """
+
+    name: str = "batch_search"
+    description: str = (
+        "Recherche web Tavily. Prend une liste de requêtes et retourne, pour "
+        "chacune, les meilleurs résultats (titre, URL, extrait)."
+    )
+    args_schema: type[BaseModel] = BatchSearchInput
+    max_results: int = 3
+    http_client: Any = Field(default=None, exclude=True)
+    # Clé fixée à la construction : l'outil peut servir hors d'une exécution
+    # de l'application, quand TAVILY_API_KEY n'est pas dans l'environnement
+    api_key: str = Field(default_factory=lambda: os.environ.get("TAVILY_API_KEY", ""), exclude=True)
+
+    def _run(self, queries: list[str]) -> str:
+        with ThreadPoolExecutor(max_workers=max(min(len(queries), MAX_RECHERCHES_PARALLELES), 1)) as pool:
+            return "\n\n".join(pool.map(self._rechercher, queries))
+
+    def _rechercher(self, query):
+        response = self.http_client.post(
+            TAVILY_URL,
+            json={"query": query, "max_results": self.max_results},
+            headers={"Authorization": f"Bearer {self.api_key}"},
+        )
+        response.raise_for_status()
+        resultats = "\n".join(
+            f"- {r['title']} ({r['url']}) : {r['content']}"
+            for r in response.json().get("results", [])
+        )
+        return f"### {query}\n{resultats}"
+
+
+# --- Agents et Crews ---
+
+# Agents copiés de votre notebook. Le rôle, l'objectif et le contexte forment
+# le prompt système : ils restent statiques (pas de {topic}) pour que ce
+# préfixe soit identique d'un appel à l'autre et profite du cache de prompt
+# d'OpenAI. Les valeurs propres à l'exécution arrivent via les tâches.
+# Les agents sont construits pour chaque Crew : CrewAI modifie les agents
+# qu'il exécute, ils ne peuvent pas être partagés entre exécutions. Seuls les
+# LLMs et l'outil de recherche, qui portent les connexions, sont partagés.
+
+def creer_analyste(search_tool, llm_fast, verbose=False):
+    """Agent 1 : l'analyste des tendances."""
+    return Agent(
+        role="Analyste de Tendances Vidéo",
+        goal="Identifier les 3 angles et sous-sujets les plus populaires et les questions "
+             "que se posent les gens sur le sujet de la tâche.",
+        backstory="Vous êtes un expert en stratégie de contenu YouTube. Vous savez "
+                  "détecter ce qui captive le public et génère de l'engagement.",
+        tools=[search_tool],
+        llm=llm_fast,
+        verbose=verbose,  # Désactivé par défaut pour une UI Streamlit propre
+        allow_delegation=False
+    )
+
+
+def creer_chercheur(search_tool, llm_fast, verbose=False):
+    """Agent 2 : le chercheur (RAG)."""
+    return Agent(
+        role="Chercheur Web Senior",
+        goal="Pour l'angle qui vous est confié, trouver 2-3 faits marquants, statistiques, ou "
+             "exemples concrets. **Chaque fait doit être accompagné de son URL source**. "
+             "Appelez `batch_search` une seule fois avec toutes vos requêtes.",
+        backstory="Vous êtes un 'fact-checker' méticuleux. Votre mission est de "
+                  "fournir des informations vérifiables et sourcées pour "
+                  "construire la crédibilité du script.",
+        tools=[search_tool],
+        llm=llm_fast,
+        verbose=verbose,
+        allow_delegation=False
+    )
+
+
+ROLE_REDACTEUR = "Rédacteur de Scripts Vidéo"
+
+
+def creer_redacteur(llm_writer, verbose=False):
+    """Agent 3 : le rédacteur de script."""
+    return Agent(
+        role=ROLE_REDACTEUR,
+        goal="Rédiger un plan de script vidéo (format Markdown) basé sur les tendances et "
+             "les faits bruts fournis. Le script doit être structuré (Intro, "
+             "Parties, Conclusion) et **intégrer les citations**.",
+        backstory="Vous êtes un scénariste de talent, capable de transformer "
+                  "des informations brutes en une histoire engageante et rythmée.",
+        llm=llm_writer,
+        verbose=verbose,
+        allow_delegation=False
+    )
+
+
+def creer_crew_tendances(search_tool, llm_fast, verbose=False):
+    """Crew de la première phase : l'analyse des tendances, seule."""
+    trend_analyst = creer_analyste(search_tool, llm_fast, verbose)
+    # Définir les Tâches (copiées de votre notebook)
+    # Tâche 1: Trouver les tendances
+    task_trends = Task(
+        description="Analyser les tendances actuelles et les questions populaires pour le sujet : {topic}.",
+        expected_output="Une liste de 3 angles de script pertinents et les questions clés.",
+        agent=trend_analyst,
+        output_pydantic=AnglesTendances,
+        async_execution=False # Streamlit fonctionne mieux en séquentiel
+    )
+
+    # Les angles doivent être connus avant de répartir la recherche : on lance
+    # d'abord l'analyse des tendances seule
+    return Crew(
+        agents=[trend_analyst],
+        tasks=[task_trends],
+        process=Process.sequential,
+        verbose=verbose, # CREW_VERBOSE=1 pour voir les logs dans le terminal
+        step_callback=journaliser_etape if verbose else None
+    )
+
+
+def angles_recherche(tendances):
+    """Angles à rechercher, tirés du résultat du Crew des tendances.
+
+    Quand CrewAI n'a pas pu convertir la réponse de l'analyste en
+    `AnglesTendances` (`pydantic` vaut alors None, par exemple si la réponse a
+    été tronquée) ou qu'elle ne contient aucun angle, la recherche porte sur la
+    réponse brute, en une seule tâche.
+    """
+    if tendances.pydantic is not None and tendances.pydantic.angles:
+        return tendances.pydantic.angles
+    if not tendances.raw or not tendances.raw.strip():
+        raise ValueError("L'analyse des tendances n'a produit aucun angle de recherche.")
+    logger.warning("Angles de l'analyste illisibles : recherche sur sa réponse brute")
+    return [tendances.raw]
+
+
+def creer_crew_script(search_tool, llm_fast, llm_writer, angles, verbose=False):
+    """Crew de la seconde phase : une recherche par angle, puis la rédaction."""
+    # Sans recherche, le rédacteur n'aurait aucun contexte et inventerait ses sources
+    if not angles:
+        raise ValueError("Aucun angle de recherche : le script ne peut pas être rédigé.")
+    # Tâche 2: Rechercher les faits, une tâche asynchrone par angle pour que
+    # les recherches s'exécutent en parallèle. Chaque tâche a son propre
+    # chercheur : un Agent n'a qu'un exécuteur (tâche et messages en cours),
+    # que des tâches simultanées sur le même agent s'écraseraient
+    chercheurs = [creer_chercheur(search_tool, llm_fast, verbose) for _ in angles[:NB_ANGLES]]
+    script_writer = creer_redacteur(llm_writer, verbose)
+    tasks_research = [
+        Task(
+            description=f"Collecter des faits, statistiques et sources pour l'angle : {angle}",
+            expected_output="Un rapport structuré avec des faits et leurs URL sources pour cet angle.",
+            agent=chercheur,
+            async_execution=True
+        )
+        for angle, chercheur in zip(angles, chercheurs)
+    ]
+
+    # Tâche 3: Rédiger le script (attend la fin des trois recherches)
+    task_script = Task(
+        description="Rédiger le plan détaillé du script vidéo en utilisant les angles et les faits sourcés. "
+                    "Durée visée de la vidéo : {duration} minutes.",
+        expected_output="Un script vidéo complet en Markdown, incluant une intro, "
+                        "plusieurs parties (une par angle) et une conclusion. "
+                        "Les citations sources doivent être incluses.",
+        agent=script_writer,
+        context=tasks_research,
+        async_execution=False
+    )
+
+    return Crew(
+        agents=[*chercheurs, script_writer],
+        tasks=[*tasks_research, task_script],
+        process=Process.sequential,  # Les tâches asynchrones consécutives tournent en parallèle
+        verbose=verbose, # CREW_VERBOSE=1 pour voir les logs dans le terminal
+        step_callback=journaliser_etape if verbose else None
+    )
+
+
+# --- Détection des scripts tronqués ---
+# CrewAI ne retourne que le texte de la réponse, mais publie sur son bus
+# d'événements la raison de fin de chaque appel LLM. On note les tâches de
+# rédaction dont un appel s'est arrêté sur la limite de tokens : seules
+# celles-ci sont suivies, car `script_complet` est appelé pour chacune
+_redactions_tronquees = set()
+_verrou_tronquees = threading.Lock()
+
+
+@crewai_event_bus.on(LLMCallCompletedEvent)
+def _noter_troncature(source, event):
+    if event.agent_role == ROLE_REDACTEUR and event.finish_reason == "length":
+        with _verrou_tronquees:
+            _redactions_tronquees.add(str(event.task_id))
+
+
+def script_complet(video_crew):
+    """Vrai si la rédaction du Crew, une fois terminé, n'a pas été coupée par la limite de tokens."""
+    # Les événements de fin d'appel sont traités dans un pool de threads
+    crewai_event_bus.flush()
+    cle = str(video_crew.tasks[-1].id)
+    with _verrou_tronquees:
+        if cle in _redactions_tronquees:
+            _redactions_tronquees.remove(cle)
+            return False
+    return True
+
+
+def texte_resultat(result):
+    """Extrait le Markdown final d'un résultat de Crew."""
+    # Le 'result.raw' contient le Markdown final
+    if result and hasattr(result, 'raw'):
+        return result.raw
+    return str(result) # Fallback si .raw n'existe pas
+
+
+# --- Génération en lot ---
+RPM_OPENAI = 500  # Requêtes par minute autorisées pour gpt-4o au palier 1
+AGENTS_PAR_CREW = 3
+MAX_CREWS_PARALLELES = 5
+
+
+# Relance, avec un délai croissant, une génération refusée par la limite de
+# débit d'OpenAI : en lot, plusieurs générations tournent en même temps
+relancer_si_limite_debit = retry(
+    wait=wait_exponential(multiplier=1, max=60),
+    retry=retry_if_exception_type(RateLimitError),
+    stop=stop_after_attempt(5),
+)
+
+
+@relancer_si_limite_debit
+async def lancer_crew_async(topic, duration, search_tool, llm_fast, llm_writer, verbose=False):
+    """Lance les deux phases du Crew sans affichage, relancées en cas de limite de débit.
+
+    Retourne le script et un booléen, faux si la rédaction a été coupée par la
+    limite de tokens.
+    """
+    # Chaque Crew a ses propres agents : les sujets traités en parallèle ne
+    # partagent pas d'état
+    tendances = await creer_crew_tendances(search_tool, llm_fast, verbose).kickoff_async(
+        inputs={'topic': topic}
+    )
+    video_crew = creer_crew_script(search_tool, llm_fast, llm_writer, angles_recherche(tendances), verbose)
+    result = await video_crew.kickoff_async(inputs={'topic': topic, 'duration': duration})
+    return texte_resultat(result), script_complet(video_crew)
+
+
+async def lancer_lot(topics, generer):
+    """Génère les scripts de plusieurs sujets en parallèle, dans la limite du débit OpenAI.
+
+    `generer` est la coroutine qui produit le résultat d'un sujet (un Crew ou
+    un prompt fusionné). Retourne, dans l'ordre des sujets, son résultat ou
+    l'exception levée.
+    """
+    # Borne calculée pour un Crew complet, qui couvre aussi le prompt fusionné
+    semaphore = asyncio.Semaphore(min(MAX_CREWS_PARALLELES, RPM_OPENAI // AGENTS_PAR_CREW))
+
+    async def lancer_borne(topic):
+        async with semaphore:
+            return await generer(topic)
+
+    return await asyncio.gather(*[lancer_borne(t) for t in topics], return_exceptions=True)
@@ -0,0 +1,105 @@
+"""Affichage dans la page Streamlit des tokens générés par les LLMs."""
+import threading
+from contextlib import contextmanager
+
+from crewai.events import crewai_event_bus
+from crewai.events.types.llm_events import LLMCallCompletedEvent, LLMStreamChunkEvent
+from langchain_core.callbacks import BaseCallbackHandler
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+
+class StreamlitTokenHandler(BaseCallbackHandler):
+    """Affiche les tokens du LLM au fil de l'eau, dans un expander par génération.
+
+    Un handler est créé pour chaque exécution, dans la session qui l'a lancée :
+    il ne doit jamais être partagé entre sessions (il porte leur conteneur et
+    leur contexte Streamlit). Il reçoit les tokens des appels LangChain via ses
+    callbacks, et ceux des agents CrewAI via `diffuser_crew`. Les buffers sont
+    indexés par génération pour que les appels, y compris ceux qui tournent en
+    parallèle, ne s'écrasent pas les uns les autres.
+    """
+
+    def __init__(self, conteneur, tous_les_n=20):
+        self.conteneur = conteneur
+        self.tous_les_n = tous_les_n
+        self.buffers = {}
+        self.placeholders = {}
+        self.verrou = threading.Lock()
+        # Les appels peuvent venir d'autres threads, qui doivent être rattachés
+        # à la session Streamlit pour pouvoir afficher
+        self.ctx = get_script_run_ctx()
+
+    def ajouter(self, cle, token, titre=None):
+        add_script_run_ctx(threading.current_thread(), self.ctx)
+        with self.verrou:
+            if cle not in self.placeholders:
+                titre = titre or f"Génération n°{len(self.placeholders) + 1}"
+                expander = self.conteneur.expander(f"✍️ {titre}", expanded=True)
+                self.placeholders[cle] = expander.empty()
+                self.buffers[cle] = []
+            buffer = self.buffers[cle]
+            buffer.append(token)
+            if len(buffer) % self.tous_les_n == 0:
+                self.placeholders[cle].markdown("".join(buffer))
+
+    def terminer(self, cle):
+        # Afficher les derniers tokens qui n'ont pas atteint le seuil de rafraîchissement
+        add_script_run_ctx(threading.current_thread(), self.ctx)
+        with self.verrou:
+            if cle in self.placeholders:
+                # Séparer la génération suivante d'un même agent, s'il y en a une
+                self.buffers[cle].append("\n\n")
+                self.placeholders[cle].markdown("".join(self.buffers[cle]))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        self.ajouter(run_id, token)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self.terminer(run_id)
+
+
+# --- Streaming des agents CrewAI ---
+# CrewAI appelle ses LLMs lui-même et ne transmet pas de callbacks LangChain :
+# les tokens des LLMs créés avec `stream=True` sont publiés sur son bus
+# d'événements, global au processus. Chaque événement porte l'id de la tâche
+# qui l'a produit, ce qui permet de le renvoyer au handler de la bonne session
+_handlers_par_tache = {}
+_verrou_handlers = threading.Lock()
+
+
+@contextmanager
+def diffuser_crew(crew, handler):
+    """Affiche via `handler` les tokens générés par les tâches de `crew`."""
+    cles = [str(task.id) for task in crew.tasks]
+    with _verrou_handlers:
+        for cle in cles:
+            _handlers_par_tache[cle] = handler
+    try:
+        yield
+    finally:
+        # Les fins d'appel sont traitées dans un pool de threads de CrewAI, pas
+        # forcément avant le retour du kickoff : on affiche ici les derniers
+        # tokens, que `_terminer_appel` ne trouverait plus à qui envoyer
+        with _verrou_handlers:
+            for cle in cles:
+                handler.terminer(cle)
+                _handlers_par_tache.pop(cle, None)
+
+
+@crewai_event_bus.on(LLMStreamChunkEvent)
+def _relayer_token(source, event):
+    cle = str(event.task_id)
+    handler = _handlers_par_tache.get(cle)
+    # Les morceaux d'arguments d'appels d'outils ne font pas partie du texte
+    if handler is not None and event.tool_call is None:
+        # Une génération par tâche : les appels successifs d'un même agent
+        # (outil puis réponse finale) s'affichent à la suite
+        handler.ajouter(cle, event.chunk, titre=event.agent_role)
+
+
+@crewai_event_bus.on(LLMCallCompletedEvent)
+def _terminer_appel(source, event):
+    cle = str(event.task_id)
+    handler = _handlers_par_tache.get(cle)
+    if handler is not None:
+        handler.terminer(cle)